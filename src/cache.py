@@ -1,76 +1,386 @@
 """Sistema de cache inteligente com Redis (conexão preguiçosa)."""
-import json
+import asyncio
+import random
 import time
-from typing import Any, Optional, Callable, Dict
+import uuid
+from typing import Any, Awaitable, Optional, Callable, Dict, List, Tuple, Type, Union
+from cachetools import TLRUCache
+import msgspec
+import orjson
 import redis
-from functools import wraps
-import threading
-from enhanced_mcp_server.settings import settings
+import redis.asyncio
+import xxhash
+import zstandard
+from functools import partial, wraps
+from enhanced_mcp_server.settings import CACHE_MAX_VALUE_BYTES, CACHE_REFRESH_PROBABILITY, CACHE_TTL, settings
 from enhanced_mcp_server.logging import get_logger
 
 logger = get_logger(__name__)
 
+# Prefixo de versão do formato gravado no Redis (permite migrações futuras).
+_FORMAT_MSGPACK = b"\x01"
+_FORMAT_MSGPACK_ZSTD = b"\x02"
+_COMPRESS_MIN_BYTES = 1024
+_ENC = msgspec.msgpack.Encoder()
+_DEC = msgspec.msgpack.Decoder()
+_ZC = zstandard.ZstdCompressor(level=3)
+_ZD = zstandard.ZstdDecompressor()
+
+def _pack(value: Any) -> memoryview:
+    # O msgpack é escrito logo após o byte de formato, sem concatenar (e copiar) o payload;
+    # o redis-py envia bytes/memoryview diretamente para o socket.
+    buf = bytearray(_FORMAT_MSGPACK)
+    _ENC.encode_into(value, buf, 1)
+    return memoryview(buf)
+
+def _compress(packed: memoryview) -> Union[bytes, memoryview]:
+    if len(packed) - 1 > _COMPRESS_MIN_BYTES:
+        return _FORMAT_MSGPACK_ZSTD + _ZC.compress(packed[1:])
+    return packed
+
+def _packed_size(value: Any) -> int:
+    # Tamanho do valor serializado, o mesmo medido no Redis: cobre strings dentro de
+    # listas/dicts, que sys.getsizeof não conta.
+    return len(_ENC.encode(value))
+
+def _too_large(key: str, size: int) -> bool:
+    if size > CACHE_MAX_VALUE_BYTES:
+        logger.debug("Cache skip: value too large", key=key, size=size, limit=CACHE_MAX_VALUE_BYTES)
+        return True
+    return False
+
+def _decode(data: bytes) -> Optional[Any]:
+    fmt = data[:1]
+    body = memoryview(data)[1:]
+    if fmt == _FORMAT_MSGPACK:
+        return _DEC.decode(body)
+    if fmt == _FORMAT_MSGPACK_ZSTD:
+        return _DEC.decode(_ZD.decompress(body))
+    logger.warning("Unknown cache payload format, ignoring entry.")
+    return None
+
+# Trava distribuída contra cache stampede: SET NX PX, renovada enquanto o dono calcula o
+# valor (uma chamada com retries pode passar de qualquer TTL fixo) e liberada via Lua.
+# Se o processo dono morrer, a trava expira em _LOCK_TTL_MS e outro assume.
+_LOCK_TTL_MS = 10_000
+_LOCK_RENEW_INTERVAL = _LOCK_TTL_MS / 3000
+_LOCK_POLL_INTERVAL = 0.05
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+_EXTEND_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+# Resultado do dono da trava gravado em "{key}:status" quando nada foi cacheado. Valor None
+# ou grande demais: quem chega chama a função diretamente, sem fila. Falha: gravada como
+# "error:<token>:<mensagem>" e repassada só a quem já aguardava aquela trava; quem chega
+# depois assume uma nova trava e tenta de novo.
+_STATUS_TTL_MS = 5_000
+_STATUS_ERROR = b"error:"
+_STATUS_BYPASS = b"bypass"
+
+class CacheFillError(Exception):
+    """O cálculo do valor falhou no processo que detinha a trava desta chave."""
+
 class Cache:
+    __slots__ = (
+        "_redis_client",
+        "_redis_checked",
+        "_memory_cache",
+        "_init_lock",
+        "_inflight",
+        "_release_lock_script",
+        "_extend_lock_script",
+    )
+
     def __init__(self):
-        self._redis_client: Optional[redis.Redis] = None
+        self._redis_client: Optional[redis.asyncio.Redis] = None
         self._redis_checked = False
-        self._memory_cache: Dict[str, Dict[str, Any]] = {}
-        self._lock = threading.Lock()
+        # Entradas são tuplas (expires_at, value, size) no relógio monotônico: cada uma
+        # expira no seu próprio prazo, e o maxsize limita a soma dos tamanhos em bytes
+        # (msgpack serializado), não o número de entradas.
+        self._memory_cache: TLRUCache = TLRUCache(
+            maxsize=settings.memory_cache_maxsize,
+            ttu=lambda _key, entry, _now: entry[0],
+            timer=time.monotonic,
+            getsizeof=lambda entry: entry[2],
+        )
+        self._init_lock = asyncio.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._release_lock_script = None
+        self._extend_lock_script = None
 
-    def get_redis_client(self) -> Optional[redis.Redis]:
-        with self._lock:
+    async def get_redis_client(self) -> Optional[redis.asyncio.Redis]:
+        if self._redis_checked:
+            return self._redis_client
+        async with self._init_lock:
             if not self._redis_checked:
-                self._redis_checked = True
                 if settings.redis_url:
+                    pool = redis.asyncio.BlockingConnectionPool.from_url(
+                        settings.redis_url, max_connections=settings.redis_pool_size, socket_connect_timeout=2
+                    )
+                    # from_pool: o cliente é dono do pool, então aclose() também o desconecta.
+                    client = redis.asyncio.Redis.from_pool(pool)
                     try:
-                        client = redis.from_url(settings.redis_url, socket_connect_timeout=2)
-                        client.ping()
+                        await client.ping()
                         self._redis_client = client
+                        self._release_lock_script = client.register_script(_RELEASE_LOCK_SCRIPT)
+                        self._extend_lock_script = client.register_script(_EXTEND_LOCK_SCRIPT)
                         logger.info("Redis cache connected successfully.")
                     except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError) as e:
                         logger.warning(f"Failed to connect to Redis, using memory cache: {e}")
+                        await client.aclose()
                         self._redis_client = None
                 else:
                     logger.info("Redis not configured, using memory cache.")
+                self._redis_checked = True
         return self._redis_client
 
-    def get(self, key: str) -> Optional[Any]:
-        redis_client = self.get_redis_client()
+    async def get(self, key: str, refresh_ttl: Optional[int] = None) -> Optional[Any]:
+        """Lê uma chave; com ``refresh_ttl``, um acerto pode renovar o TTL (janela deslizante).
+
+        A renovação é sorteada com probabilidade ``CACHE_REFRESH_PROBABILITY`` para que
+        chaves quentes não gerem um EXPIRE a cada leitura.
+        """
+        refresh = refresh_ttl is not None and random.random() < CACHE_REFRESH_PROBABILITY
+        redis_client = await self.get_redis_client()
         if redis_client:
-            data = redis_client.get(key)
-            return json.loads(data) if data else None
+            if refresh:
+                # GET + EXPIRE no mesmo round trip.
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    data, _ = await pipe.get(key).expire(key, refresh_ttl).execute()
+            else:
+                data = await redis_client.get(key)
+            return _decode(data) if data else None
         else:
-            with self._lock:
-                entry = self._memory_cache.get(key)
-                if entry and time.time() < entry["expires_at"]:
-                    return entry["value"]
+            # O cache em memória só é acessado pela thread do event loop.
+            entry = self._memory_cache.get(key)
+            if entry is not None:
+                _, value, size = entry
+                if refresh:
+                    self._memory_cache[key] = (time.monotonic() + refresh_ttl, value, size)
+                return value
         return None
 
-    def set(self, key: str, value: Any, ttl: int):
-        redis_client = self.get_redis_client()
+    async def set(self, key: str, value: Any, ttl: int) -> bool:
+        """Grava a chave; retorna False se o valor excede ``CACHE_MAX_VALUE_BYTES``."""
+        redis_client = await self.get_redis_client()
         if redis_client:
-            redis_client.setex(key, ttl, json.dumps(value))
+            packed = _pack(value)
+            if _too_large(key, len(packed) - 1):
+                return False
+            await redis_client.set(key, _compress(packed), ex=ttl)
         else:
-            with self._lock:
-                self._memory_cache[key] = {"value": value, "expires_at": time.time() + ttl}
+            size = _packed_size(value)
+            if _too_large(key, size):
+                return False
+            self._memory_cache[key] = (time.monotonic() + ttl, value, size)
+        return True
+
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Lê várias chaves em um único round trip (MGET no Redis)."""
+        if not keys:
+            return []
+        redis_client = await self.get_redis_client()
+        if redis_client:
+            return [_decode(data) if data else None for data in await redis_client.mget(keys)]
+        entries = [self._memory_cache.get(key) for key in keys]
+        return [entry[1] if entry is not None else None for entry in entries]
+
+    async def mset(self, items: Dict[str, Any], ttl: int):
+        """Grava várias chaves com o mesmo TTL; no Redis, um SET EX por chave em um único pipeline."""
+        if not items:
+            return
+        redis_client = await self.get_redis_client()
+        if redis_client:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    packed = _pack(value)
+                    if not _too_large(key, len(packed) - 1):
+                        pipe.set(key, _compress(packed), ex=ttl)
+                await pipe.execute()
+        else:
+            expires_at = time.monotonic() + ttl
+            for key, value in items.items():
+                size = _packed_size(value)
+                if not _too_large(key, size):
+                    self._memory_cache[key] = (expires_at, value, size)
+
+    async def get_or_set(
+        self,
+        key: str,
+        ttl: int,
+        coro_factory: Callable[[], Awaitable[Any]],
+        shared_errors: Tuple[Type[Exception], ...] = (),
+    ) -> Any:
+        """Retorna o valor em cache ou o calcula uma única vez entre chamadas concorrentes.
+
+        No mesmo processo, todas as chamadas aguardam o mesmo cálculo e recebem o mesmo
+        resultado ou exceção; entre processos, a coordenação é feita pela trava no Redis.
+        Processos que aguardavam a trava recebem ``CacheFillError`` apenas se o dono falhou
+        com uma exceção de ``shared_errors``; nos demais casos, tentam de novo eles mesmos.
+        """
+        value = await self.get(key, refresh_ttl=ttl)
+        if value is not None:
+            logger.debug("Cache hit", key=key)
+            return value
+
+        logger.debug("Cache miss", key=key)
+        fill = self._inflight.get(key)
+        if fill is None:
+            fill = asyncio.ensure_future(self._fill(key, ttl, coro_factory, shared_errors))
+            self._inflight[key] = fill
+            fill.add_done_callback(partial(self._fill_done, key))
+        # shield: cancelar quem aguarda não cancela o cálculo compartilhado.
+        return await asyncio.shield(fill)
+
+    def _fill_done(self, key: str, fill: asyncio.Future):
+        if self._inflight.get(key) is fill:
+            del self._inflight[key]
+        if not fill.cancelled():
+            fill.exception()  # Marca a exceção como consumida mesmo sem ninguém aguardando.
+
+    async def _fill(
+        self,
+        key: str,
+        ttl: int,
+        coro_factory: Callable[[], Awaitable[Any]],
+        shared_errors: Tuple[Type[Exception], ...],
+    ) -> Any:
+        redis_client = await self.get_redis_client()
+        if redis_client:
+            return await self._redis_fill(redis_client, key, ttl, coro_factory, shared_errors)
+        value = await coro_factory()
+        if value is not None:
+            await self.set(key, value, ttl)
+        return value
+
+    async def _redis_fill(
+        self,
+        redis_client: redis.asyncio.Redis,
+        key: str,
+        ttl: int,
+        coro_factory: Callable[[], Awaitable[Any]],
+        shared_errors: Tuple[Type[Exception], ...],
+    ) -> Any:
+        lock_key = f"{key}:lock"
+        status_key = f"{key}:status"
+        token = uuid.uuid4().hex.encode()
+        waiting_on = None  # Token da trava que este processo está aguardando.
+        while True:
+            data, status, holder = await redis_client.mget(key, status_key, lock_key)
+            value = _decode(data) if data else None
+            if value is not None:
+                return value
+            if status == _STATUS_BYPASS:
+                return await coro_factory()
+            if waiting_on is not None and status is not None:
+                prefix = _STATUS_ERROR + waiting_on + b":"
+                if status.startswith(prefix):
+                    raise CacheFillError(status[len(prefix):].decode(errors="replace"))
+            if holder is None and await redis_client.set(lock_key, token, nx=True, px=_LOCK_TTL_MS):
+                break
+            if holder is not None:
+                waiting_on = holder
+            await asyncio.sleep(_LOCK_POLL_INTERVAL)
+
+        keepalive = asyncio.create_task(self._keep_lock(lock_key, token))
+        try:
+            # O dono anterior pode ter gravado o valor entre o MGET e o SET NX.
+            data = await redis_client.get(key)
+            value = _decode(data) if data else None
+            if value is not None:
+                return value
+            try:
+                value = await coro_factory()
+            except shared_errors as e:
+                status = _STATUS_ERROR + token + b":" + str(e).encode()[:1024]
+                await redis_client.set(status_key, status, px=_STATUS_TTL_MS)
+                raise
+            if value is None:
+                await redis_client.set(status_key, _STATUS_BYPASS, px=_STATUS_TTL_MS)
+            elif not await self.set(key, value, ttl):
+                # Grande demais para o cache: durante o TTL da entrada, os demais processos
+                # chamam a função diretamente em vez de enfileirar na trava.
+                await redis_client.set(status_key, _STATUS_BYPASS, ex=ttl)
+            return value
+        finally:
+            keepalive.cancel()
+            await self._release_lock_script(keys=[lock_key], args=[token])
+
+    async def _keep_lock(self, lock_key: str, token: str):
+        """Renova a trava enquanto o cálculo do dono estiver em andamento."""
+        try:
+            while True:
+                await asyncio.sleep(_LOCK_RENEW_INTERVAL)
+                if not await self._extend_lock_script(keys=[lock_key], args=[token, _LOCK_TTL_MS]):
+                    return
+        except redis.exceptions.RedisError as e:
+            logger.warning("Failed to renew cache lock", key=lock_key, error=str(e))
+
+def _make_key(name: str, *parts: Any) -> str:
+    payload = orjson.dumps((name, *parts), option=orjson.OPT_SORT_KEYS)
+    return f"{name}:{xxhash.xxh3_64_hexdigest(payload)}"
+
+def cached(ttl: Optional[int] = None, shared_errors: Tuple[Type[Exception], ...] = ()):
+    """Cacheia o resultado de uma função assíncrona; ``_nocache=True`` na chamada ignora o cache.
+
+    ``shared_errors`` lista as exceções repassadas (como ``CacheFillError``) a outros
+    processos que aguardavam o mesmo cálculo; veja ``Cache.get_or_set``.
+    """
+    final_ttl = ttl if ttl is not None else CACHE_TTL
 
-def cached(ttl: Optional[int] = None):
     def decorator(func: Callable):
+        name = func.__name__
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            final_ttl = ttl if ttl is not None else settings.cache_ttl
-            cache_key = f"{func.__name__}:{json.dumps(args, sort_keys=True)}:{json.dumps(kwargs, sort_keys=True)}"
-            
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                logger.debug("Cache hit", key=cache_key)
-                return cached_result
-
-            logger.debug("Cache miss", key=cache_key)
-            result = await func(*args, **kwargs)
-            if result is not None:
-                cache.set(cache_key, result, final_ttl)
-            return result
+            if kwargs.pop("_nocache", False):
+                return await func(*args, **kwargs)
+            cache_key = _make_key(name, args, kwargs)
+            return await cache.get_or_set(cache_key, final_ttl, lambda: func(*args, **kwargs), shared_errors)
+        return wrapper
+    return decorator
+
+def cached_batch(ttl: Optional[int] = None):
+    """Variante de ``cached`` para funções que recebem uma lista e retornam uma lista alinhada.
+
+    Cada elemento é cacheado individualmente; apenas os ausentes do cache são repassados
+    à função, e todas as leituras/gravações usam um único round trip (MGET/pipeline).
+    """
+    final_ttl = ttl if ttl is not None else CACHE_TTL
+
+    def decorator(func: Callable):
+        name = func.__name__
+
+        @wraps(func)
+        async def wrapper(items: List[Any], *args, **kwargs):
+            if kwargs.pop("_nocache", False):
+                return await func(items, *args, **kwargs)
+            keys = [_make_key(name, item, args, kwargs) for item in items]
+            results = await cache.mget(keys)
+            missing = [i for i, result in enumerate(results) if result is None]
+            if missing:
+                logger.debug("Batch cache miss", missing=len(missing), total=len(keys))
+                fresh = await func([items[i] for i in missing], *args, **kwargs)
+                if len(fresh) != len(missing):
+                    raise ValueError(
+                        f"{name} returned {len(fresh)} results for {len(missing)} items; "
+                        "cached_batch functions must return one result per item."
+                    )
+                to_store = {}
+                for i, value in zip(missing, fresh):
+                    results[i] = value
+                    if value is not None:
+                        to_store[keys[i]] = value
+                await cache.mset(to_store, final_ttl)
+            return results
         return wrapper
     return decorator
 
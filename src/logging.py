@@ -1,32 +1,47 @@
 """Sistema de logging estruturado."""
+import logging
 import sys
 from typing import Any
+import orjson
 import structlog
 from enhanced_mcp_server.settings import settings
 
 _LOGGING_CONFIGURED = False
 
+def _orjson_dumps(obj: Any, **kwargs: Any) -> str:
+    return orjson.dumps(obj, **kwargs).decode()
+
 def setup_logging() -> None:
     """Configura o sistema de logging."""
     global _LOGGING_CONFIGURED
     if _LOGGING_CONFIGURED:
         return
 
+    level = getattr(logging, settings.log_level.upper())
+    if settings.log_json:
+        renderers = [
+            structlog.processors.format_exc_info,
+            structlog.processors.JSONRenderer(serializer=_orjson_dumps),
+        ]
+    else:
+        renderers = [structlog.dev.ConsoleRenderer()]
+
     structlog.configure(
         processors=[
             structlog.stdlib.add_log_level,
             structlog.processors.TimeStamper(fmt="iso"),
-            structlog.dev.ConsoleRenderer(),
+            *renderers,
         ],
+        # Descarta chamadas abaixo do nível configurado antes de montar o event dict.
+        wrapper_class=structlog.make_filtering_bound_logger(level),
         logger_factory=structlog.stdlib.LoggerFactory(),
         cache_logger_on_first_use=True,
     )
     
-    import logging
     logging.basicConfig(
         format="%(message)s",
         stream=sys.stdout,
-        level=settings.log_level.upper(),
+        level=level,
     )
     _LOGGING_CONFIGURED = True
 
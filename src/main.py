@@ -8,7 +8,10 @@ from enhanced_mcp_server.settings import settings
 def main():
     setup_logging()
     server = create_server()
-    uvicorn.run(server, host="0.0.0.0", port=settings.port)
+    # loop/http ficam em "auto": o uvicorn usa uvloop e httptools (instalados pelo extra
+    # [standard]) quando disponíveis e cai para asyncio/h11 onde não há, como no Windows.
+    # log_config=None mantém o logging configurado por setup_logging().
+    uvicorn.run(server, host="0.0.0.0", port=settings.port, log_config=None)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
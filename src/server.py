@@ -10,21 +10,29 @@ logger = get_logger(__name__)
 # @smithery.server()
 def create_server():
     mcp = FastMCP(name="enhanced-mcp-server")
+    # Dependências das ferramentas vinculadas ao closure: cada chamada usa LOAD_DEREF em vez de
+    # LOAD_GLOBAL. O FastMCP não aceita parâmetros extras (viram argumentos da ferramenta).
+    fetch_impl = fetch_content
+    search_impl = search_web
+    validation_error = ValidationError
+    tool_logger = logger
 
     @mcp.tool(name="fetch", description="Fetches the content of a web page.")
     async def fetch(url: str = Field(description="The URL of the webpage to fetch.")) -> str:
         try:
-            return await fetch_content(url)
-        except ValidationError as e:
-            logger.warning("Fetch validation error", url=url, error=str(e))
-            return f"Error: {str(e)}"
+            return await fetch_impl(url)
+        except validation_error as e:
+            message = str(e)
+            tool_logger.warning("Fetch validation error", url=url, error=message)
+            return f"Error: {message}"
 
     @mcp.tool(name="search", description="Searches the web for a given query.")
     async def search(query: str = Field(description="The search query.")) -> str:
         try:
-            return await search_web(query)
-        except ValidationError as e:
-            logger.warning("Search validation error", query=query, error=str(e))
-            return f"Error: {str(e)}"
+            return await search_impl(query)
+        except validation_error as e:
+            message = str(e)
+            tool_logger.warning("Search validation error", query=query, error=message)
+            return f"Error: {message}"
 
     return mcp
\ No newline at end of file
@@ -11,10 +11,15 @@ class Settings(BaseSettings):
 
     # Cache
     redis_url: Optional[str] = None
+    redis_pool_size: int = 32
     cache_ttl: int = 3600
+    memory_cache_maxsize: int = 128 * 1024 * 1024  # bytes
+    cache_refresh_probability: float = 0.1
+    cache_max_value_bytes: int = 512 * 1024
 
     # Logging
     log_level: str = "INFO"
+    log_json: bool = False
 
     # Timeouts
     request_timeout: int = 30
@@ -25,4 +30,11 @@ class Settings(BaseSettings):
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
+
+# Valores lidos no caminho quente de cada chamada de ferramenta, fixados na inicialização.
+JINA_API_KEY = settings.jina_api_key
+REQUEST_TIMEOUT = settings.request_timeout
+CACHE_TTL = settings.cache_ttl
+CACHE_REFRESH_PROBABILITY = settings.cache_refresh_probability
+CACHE_MAX_VALUE_BYTES = settings.cache_max_value_bytes
\ No newline at end of file
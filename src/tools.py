@@ -1,7 +1,10 @@
 """Ferramentas MCP para busca e tradução."""
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
 import httpx
-from enhanced_mcp_server.settings import settings
-from enhanced_mcp_server.cache import cached
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from enhanced_mcp_server.settings import JINA_API_KEY, REQUEST_TIMEOUT
+from enhanced_mcp_server.cache import CacheFillError, cached
 from enhanced_mcp_server.logging import get_logger
 
 logger = get_logger(__name__)
@@ -9,36 +12,97 @@ logger = get_logger(__name__)
 class ValidationError(Exception):
     pass
 
-@cached(ttl=1800)
-async def fetch_content(url: str) -> str:
-    if not settings.jina_api_key:
+_client: Optional[httpx.AsyncClient] = None
+
+def _get_client() -> httpx.AsyncClient:
+    """Retorna o cliente HTTP compartilhado, criando-o na primeira chamada."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            headers={"Authorization": f"Bearer {JINA_API_KEY}"},
+        )
+    return _client
+
+# Falhas de rede transitórias: repetidas com backoff exponencial e jitter.
+_TRANSIENT_ERRORS = (httpx.ConnectError, httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+@retry(
+    retry=retry_if_exception_type(_TRANSIENT_ERRORS),
+    stop=stop_after_attempt(3),
+    wait=wait_random_exponential(multiplier=0.2, max=2),
+    reraise=True,
+)
+async def _jina_get(url: str) -> str:
+    response = await _get_client().get(url)
+    response.raise_for_status()
+    return response.text
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def _canon_url(url: str) -> str:
+    """Valida a URL e retorna sua forma canônica, usada como chave de cache."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        raise ValidationError(f"Invalid URL: {url!r}. Only absolute http(s) URLs are supported.")
+    try:
+        port = parts.port
+    except ValueError:
+        raise ValidationError(f"Invalid port in URL: {url!r}")
+
+    host = parts.hostname
+    netloc = f"[{host}]" if ":" in host else host
+    if port is not None and port != _DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    userinfo, sep, _ = parts.netloc.rpartition("@")
+    if sep:
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+async def fetch_content(url: str, _nocache: bool = False) -> str:
+    try:
+        return await _fetch_content(_canon_url(url), _nocache=_nocache)
+    except CacheFillError as e:
+        raise ValidationError(str(e))
+
+async def search_web(query: str, _nocache: bool = False) -> str:
+    query = " ".join(query.split())
+    if not query:
+        raise ValidationError("Search query must not be empty.")
+    try:
+        return await _search_web(query, _nocache=_nocache)
+    except CacheFillError as e:
+        raise ValidationError(str(e))
+
+@cached(ttl=1800, shared_errors=(ValidationError,))
+async def _fetch_content(url: str) -> str:
+    if not JINA_API_KEY:
         raise ValidationError("JINA_API_KEY is not configured.")
     try:
-        async with httpx.AsyncClient(timeout=settings.request_timeout) as client:
-            response = await client.get(
-                f"https://r.jina.ai/{url}",
-                headers={"Authorization": f"Bearer {settings.jina_api_key}"},
-            )
-            response.raise_for_status()
-            return response.text
+        return await _jina_get(f"https://r.jina.ai/{url}")
     except httpx.HTTPStatusError as e:
         raise ValidationError(f"HTTP error {e.response.status_code}")
+    except httpx.TransportError as e:
+        logger.warning("Network error during fetch", url=url, error=str(e))
+        raise ValidationError(f"Failed to fetch content: {str(e)}")
     except Exception as e:
         logger.error("Error during fetch", url=url, error=str(e))
         raise ValidationError(f"Failed to fetch content: {str(e)}")
 
-@cached(ttl=900)
-async def search_web(query: str) -> str:
-    if not settings.jina_api_key:
+@cached(ttl=900, shared_errors=(ValidationError,))
+async def _search_web(query: str) -> str:
+    if not JINA_API_KEY:
         raise ValidationError("JINA_API_KEY is not configured.")
     try:
-        async with httpx.AsyncClient(timeout=settings.request_timeout) as client:
-            response = await client.get(
-                f"https://s.jina.ai/?q={query}",
-                headers={"Authorization": f"Bearer {settings.jina_api_key}"},
-            )
-            response.raise_for_status()
-            return response.text
+        return await _jina_get(f"https://s.jina.ai/?q={query}")
+    except httpx.HTTPStatusError as e:
+        raise ValidationError(f"HTTP error {e.response.status_code}")
+    except httpx.TransportError as e:
+        logger.warning("Network error during search", query=query, error=str(e))
+        raise ValidationError(f"Failed to search: {str(e)}")
     except Exception as e:
         logger.error("Error during search", query=query, error=str(e))
         raise ValidationError(f"Failed to search: {str(e)}")
\ No newline at end of file
@@ -1,8 +1,14 @@
 """Testes básicos para o Enhanced MCP Server."""
+import asyncio
+import fakeredis
+import httpx
 import pytest
+import redis.asyncio
+import tenacity
 from enhanced_mcp_server.settings import Settings
-from unittest.mock import patch, AsyncMock
-from enhanced_mcp_server.tools import fetch_content, search_web, ValidationError
+from unittest.mock import patch, AsyncMock, Mock
+from enhanced_mcp_server.cache import Cache, CacheFillError, cached, cached_batch, _compress, _decode, _pack
+from enhanced_mcp_server.tools import fetch_content, search_web, ValidationError, _canon_url, _jina_get
 
 def test_settings():
     """Testa se as configurações são carregadas corretamente."""
@@ -12,6 +18,7 @@ def test_settings():
     assert settings.request_timeout == 30
 
 @pytest.mark.asyncio
+@patch('enhanced_mcp_server.tools.JINA_API_KEY', 'test-key')
 async def test_fetch_content_valid_url():
     with patch('httpx.AsyncClient.get', new_callable=AsyncMock) as mock_get:
         mock_response = AsyncMock()
@@ -29,6 +36,35 @@ async def test_fetch_content_invalid_url():
         await fetch_content("invalid-url")
 
 @pytest.mark.asyncio
+@patch('enhanced_mcp_server.tools.JINA_API_KEY', 'test-key')
+async def test_fetch_content_retries_transient_errors():
+    with patch('httpx.AsyncClient.get', new_callable=AsyncMock) as mock_get, \
+            patch.object(_jina_get.retry, 'wait', tenacity.wait_none()):
+        mock_response = AsyncMock()
+        mock_response.text = "Fetched after retry"
+        mock_response.raise_for_status = Mock()
+        mock_get.side_effect = [httpx.ConnectError("connection refused"), mock_response]
+
+        result = await fetch_content("https://example.com/retry")
+        assert result == "Fetched after retry"
+        assert mock_get.call_count == 2
+
+@pytest.mark.asyncio
+@patch('enhanced_mcp_server.tools.JINA_API_KEY', 'test-key')
+async def test_fetch_content_nocache():
+    with patch('httpx.AsyncClient.get', new_callable=AsyncMock) as mock_get:
+        mock_response = AsyncMock()
+        mock_response.text = "Fresh content"
+        mock_response.raise_for_status = Mock()
+        mock_get.return_value = mock_response
+
+        assert await fetch_content("https://example.com/fresh") == "Fresh content"
+        assert await fetch_content("https://example.com/fresh") == "Fresh content"
+        assert await fetch_content("https://example.com/fresh", _nocache=True) == "Fresh content"
+        assert mock_get.call_count == 2
+
+@pytest.mark.asyncio
+@patch('enhanced_mcp_server.tools.JINA_API_KEY', 'test-key')
 async def test_search_web_valid_query():
     with patch('httpx.AsyncClient.get', new_callable=AsyncMock) as mock_get:
         mock_response = AsyncMock()
@@ -43,4 +79,249 @@ async def test_search_web_valid_query():
 @pytest.mark.asyncio
 async def test_search_web_empty_query():
     with pytest.raises(ValidationError):
-        await search_web("")
\ No newline at end of file
+        await search_web("")
+
+@pytest.mark.asyncio
+async def test_cached_single_flight():
+    """Chamadas concorrentes com a mesma chave executam a função uma única vez."""
+    calls = 0
+
+    @cached(ttl=60)
+    async def slow_double(x: int) -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return x * 2
+
+    results = await asyncio.gather(*(slow_double(21) for _ in range(10)))
+    assert results == [42] * 10
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_single_flight_shares_failures():
+    """Uma falha é repassada a todos que aguardavam, sem refazer a chamada em fila."""
+    calls = 0
+
+    @cached(ttl=60)
+    async def failing() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*(failing() for _ in range(5)), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert calls == 1
+
+
+def test_cache_payload_roundtrip():
+    """Payloads grandes são comprimidos com zstd e decodificados de volta."""
+    small = _compress(_pack({"text": "hello"}))
+    large = _compress(_pack("conteúdo " * 1000))
+    assert small[:1] == b"\x01"
+    assert large[:1] == b"\x02"
+    assert len(large) < len("conteúdo " * 1000)
+    assert _decode(small) == {"text": "hello"}
+    assert _decode(large) == "conteúdo " * 1000
+
+
+def test_canon_url():
+    """URLs equivalentes colapsam para a mesma forma canônica."""
+    assert _canon_url("HTTP://Example.com:80") == "http://example.com/"
+    assert _canon_url("https://example.com:443/a?b=1#frag") == "https://example.com/a?b=1"
+    assert _canon_url("https://example.com:8443/") == "https://example.com:8443/"
+    with pytest.raises(ValidationError):
+        _canon_url("ftp://example.com/")
+
+
+@pytest.mark.asyncio
+async def test_cached_batch_only_fetches_missing_items():
+    """Itens já cacheados não são repassados novamente à função."""
+    seen = []
+
+    @cached_batch(ttl=60)
+    async def squares(items: list) -> list:
+        seen.append(list(items))
+        return [item * item for item in items]
+
+    assert await squares([1, 2]) == [1, 4]
+    assert await squares([2, 3, 1]) == [4, 9, 1]
+    assert seen == [[1, 2], [3]]
+
+
+@pytest.mark.asyncio
+async def test_cached_batch_rejects_misaligned_results():
+    @cached_batch(ttl=60)
+    async def drops_last(items: list) -> list:
+        return items[:-1]
+
+    with pytest.raises(ValueError):
+        await drops_last(["a", "b"])
+
+
+@pytest.mark.asyncio
+async def test_cached_nocache_bypasses_cache():
+    calls = 0
+
+    @cached(ttl=60)
+    async def counter() -> int:
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert await counter() == 1
+    assert await counter() == 1
+    assert await counter(_nocache=True) == 2
+
+
+@pytest.mark.asyncio
+@patch('enhanced_mcp_server.cache.CACHE_MAX_VALUE_BYTES', 1024)
+async def test_cached_oversize_value_is_shared_but_not_stored():
+    """Valores grandes demais não são cacheados, mas chamadas concorrentes os compartilham."""
+    calls = 0
+
+    @cached(ttl=60)
+    async def big_page() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "x" * 10_000
+
+    results = await asyncio.gather(*(big_page() for _ in range(5)))
+    assert all(len(r) == 10_000 for r in results)
+    assert calls == 1
+    await big_page()
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+@patch('enhanced_mcp_server.cache.CACHE_MAX_VALUE_BYTES', 1024)
+async def test_memory_cache_measures_nested_values():
+    """O limite considera o conteúdo de listas/dicts, não só o container."""
+    memory_cache = Cache()
+    assert not await memory_cache.set("nested", {"pages": ["x" * 600, "y" * 600]}, 60)
+    assert await memory_cache.get("nested") is None
+    assert await memory_cache.set("small", {"pages": ["x" * 10]}, 60)
+
+
+@pytest.mark.asyncio
+@patch('enhanced_mcp_server.cache.settings.memory_cache_maxsize', 4096)
+async def test_memory_cache_is_bounded_in_bytes():
+    """O cache em memória despeja entradas pelo total de bytes, não pela contagem."""
+    memory_cache = Cache()
+    for i in range(4):
+        assert await memory_cache.set(f"page{i}", "x" * 1500, 60)
+    assert await memory_cache.mget([f"page{i}" for i in range(4)]) == [None, None, "x" * 1500, "x" * 1500]
+
+
+@pytest.fixture
+def fake_redis_server(monkeypatch):
+    """Faz ``Cache`` conectar a um Redis falso (fakeredis) pelo caminho normal de inicialização."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr("enhanced_mcp_server.cache.settings.redis_url", "redis://fake:6379/0")
+    monkeypatch.setattr(redis.asyncio.Redis, "from_pool", lambda pool: fakeredis.FakeAsyncRedis(server=server))
+    return server
+
+
+@pytest.mark.asyncio
+async def test_redis_set_get_plain_and_zstd(fake_redis_server):
+    redis_cache = Cache()
+    client = await redis_cache.get_redis_client()
+    assert client is not None
+
+    await redis_cache.set("small", {"text": "hello"}, 60)
+    await redis_cache.set("large", "conteúdo " * 1000, 60)
+    assert (await client.get("small"))[:1] == b"\x01"
+    assert (await client.get("large"))[:1] == b"\x02"
+    assert 0 < await client.ttl("large") <= 60
+    assert await redis_cache.get("small") == {"text": "hello"}
+    assert await redis_cache.get("large") == "conteúdo " * 1000
+    assert await redis_cache.get("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_redis_get_or_set_single_flight(fake_redis_server):
+    redis_cache = Cache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "value"
+
+    results = await asyncio.gather(*(redis_cache.get_or_set("key", 60, compute) for _ in range(10)))
+    assert results == ["value"] * 10
+    assert calls == 1
+    client = await redis_cache.get_redis_client()
+    assert await client.exists("key:lock") == 0
+    assert await redis_cache.get("key") == "value"
+
+
+@pytest.mark.asyncio
+async def test_redis_get_or_set_shares_failures_across_processes(fake_redis_server):
+    """Um processo aguardando a trava falha rápido quando o dono falha; quem chega depois tenta de novo."""
+    owner, waiter = Cache(), Cache()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(
+        owner.get_or_set("key", 60, failing, shared_errors=(RuntimeError,)),
+        waiter.get_or_set("key", 60, failing, shared_errors=(RuntimeError,)),
+        return_exceptions=True,
+    )
+    assert sorted(type(r).__name__ for r in results) == ["CacheFillError", "RuntimeError"]
+    assert calls == 1
+    with pytest.raises(RuntimeError):
+        await waiter.get_or_set("key", 60, failing, shared_errors=(RuntimeError,))
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_get_or_set_retries_unshared_failures(fake_redis_server):
+    """Exceções fora de ``shared_errors`` não são repassadas: o processo que aguardava tenta de novo."""
+    owner, waiter = Cache(), Cache()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        raise TypeError("bug")
+
+    results = await asyncio.gather(
+        owner.get_or_set("key", 60, failing),
+        waiter.get_or_set("key", 60, failing),
+        return_exceptions=True,
+    )
+    assert [type(r) for r in results] == [TypeError, TypeError]
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+@patch('enhanced_mcp_server.cache.CACHE_REFRESH_PROBABILITY', 1.0)
+async def test_redis_get_refreshes_ttl(fake_redis_server):
+    redis_cache = Cache()
+    client = await redis_cache.get_redis_client()
+    await redis_cache.set("key", "value", 10)
+
+    assert await redis_cache.get("key", refresh_ttl=100) == "value"
+    assert await client.ttl("key") > 10
+    assert await redis_cache.get("missing", refresh_ttl=100) is None
+
+
+@pytest.mark.asyncio
+async def test_redis_mget_mset(fake_redis_server):
+    redis_cache = Cache()
+    client = await redis_cache.get_redis_client()
+    await redis_cache.mset({"a": 1, "b": "x" * 5000}, 60)
+
+    assert await redis_cache.mget(["a", "missing", "b"]) == [1, None, "x" * 5000]
+    assert 0 < await client.ttl("b") <= 60
+    assert await redis_cache.mget([]) == []